@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+"""Convert Kokoro voicepacks to .safetensors, which kokoro_backend.py loads without unpickling"""
+import argparse
+import torch
+from pathlib import Path
+from safetensors.torch import save_file
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument('voices_path', help='Directory containing the .pt voice files')
+args = parser.parse_args()
+
+for voice_file in sorted(Path(args.voices_path).glob("*.pt")):
+    voice_data = torch.load(voice_file, weights_only=True, map_location='cpu')
+    # Written next to the .pt file, which the backend still falls back to
+    save_file({'emb': voice_data.contiguous()}, str(voice_file.with_suffix('.safetensors')))
+    print(f"Converted {voice_file.name}")
@@ -1,14 +1,22 @@
 #!/usr/bin/env python3
 import sys
-import json
+import argparse
+import orjson
 import torch
 import os
+import re
 import numpy
 from pathlib import Path
+from collections import OrderedDict
 import asyncio
+import threading
+import contextlib
+import functools
+from concurrent.futures import ThreadPoolExecutor
 import websockets
 import logging
 import signal
+import time
 import warnings
 
 # Filter out specific PyTorch warnings
@@ -26,32 +34,280 @@ logging.basicConfig(
 os.environ["PHONEMIZER_ESPEAK_LIBRARY"] = r"C:\Program Files\eSpeak NG\libespeak-ng.dll"
 os.environ["PHONEMIZER_ESPEAK_PATH"] = r"C:\Program Files\eSpeak NG\espeak-ng.exe"
 
-# Get Kokoro root from first argument
-if len(sys.argv) < 3:
-    logging.error("Usage: kokoro_backend.py <model_path> <voices_path>")
-    sys.exit(1)
+parser = argparse.ArgumentParser(description='Kokoro TTS backend')
+parser.add_argument('model_path', help='Path to the Kokoro model file (kokoro-v0_19.pth)')
+parser.add_argument('voices_path', help='Path to the voices directory')
+parser.add_argument('--compile', action=argparse.BooleanOptionalAction, default=None,
+                    help='Compile the model with torch.compile (needs Triton for CUDA, slows down startup)')
+parser.add_argument('--fp16', action='store_true', help='Run the model under reduced precision autocast')
+parser.add_argument('--no-warmup', dest='warmup', action='store_false',
+                    help='Skip the throwaway synthesis run at startup (--compile/--fp16 still run their check pass)')
+parser.add_argument('--workers', type=int, default=1,
+                    help='Number of synthesis requests run in parallel (more than 1 only helps on CUDA)')
+parser.add_argument('--backend', choices=('pytorch', 'onnx'), default='pytorch',
+                    help='Inference engine (onnx falls back to pytorch if onnxruntime is missing)')
+parser.add_argument('--onnx-model', help='Path to the ONNX model (default: model path with .onnx extension)')
+args = parser.parse_args()
 
-kokoro_root = os.path.dirname(os.path.abspath(sys.argv[1]))
+# Get Kokoro root from the model path
+kokoro_root = os.path.dirname(os.path.abspath(args.model_path))
 sys.path.append(kokoro_root)
 
 try:
     from models import build_model
-    from kokoro import generate
+    from kokoro import forward, phonemize, tokenize
     logging.info("Imported Kokoro modules")
 except ImportError as e:
     logging.error(f"Could not import Kokoro modules from {kokoro_root}")
     raise
 
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+try:
+    from safetensors.torch import load_file as load_safetensors
+except ImportError:
+    load_safetensors = None
+
+# Audio libraries are loaded once here, the backend still generates (but cannot play/save) without them
+try:
+    import sounddevice as sd
+except (ImportError, OSError):  # OSError: PortAudio library not found
+    sd = None
+
+try:
+    import soundfile as sf
+except (ImportError, OSError):  # OSError: libsndfile not found
+    sf = None
+
+TORCH_VERSION = tuple(int(part) for part in re.findall(r'\d+', torch.__version__)[:2])
+
+# Longest phoneme sequence the model (and its 511-entry voicepacks) accepts
+MAX_TOKENS = 510
+# Fixed lengths PL-BERT's tokens are padded to, so graphs are captured/compiled for a few shapes only
+TOKEN_BUCKETS = (64, 128, 256, 512)
+# Boundaries to split overlong phonemes at, from most to least natural
+SPLIT_PATTERNS = (r'(?<=[.!?])\s+', r'(?<=[,;:])\s+', r'\s+')
+
+def split_phonemes(phonemes, level=0):
+    """Split phonemes into pieces of at most MAX_TOKENS tokens, preferring sentence, then clause, then word boundaries"""
+    if len(tokenize(phonemes)) <= MAX_TOKENS or level == len(SPLIT_PATTERNS):
+        return [phonemes]
+    
+    pieces = []
+    current = ''
+    for part in re.split(SPLIT_PATTERNS[level], phonemes):
+        candidate = f"{current} {part}" if current else part
+        if len(tokenize(candidate)) <= MAX_TOKENS:
+            current = candidate
+            continue
+        if current:
+            pieces.append(current)
+        if len(tokenize(part)) > MAX_TOKENS:
+            pieces.extend(split_phonemes(part, level + 1))
+            current = ''
+        else:
+            current = part
+    if current:
+        pieces.append(current)
+    return pieces
+
+def forward_batch(model, token_lists, ref_s, speed=1):
+    """Batched kokoro.forward(): the mask-aware text encoders run once over the padded batch, while the
+    duration LSTM, alignment and decoder run per sample since padding would change their output"""
+    device = ref_s.device
+    tokens = torch.nn.utils.rnn.pad_sequence(
+        [torch.LongTensor([0, *token_list, 0]) for token_list in token_lists], batch_first=True
+    ).to(device)
+    input_lengths = torch.LongTensor([len(token_list) + 2 for token_list in token_lists]).to(device)
+    text_mask = torch.arange(tokens.shape[1], device=device).unsqueeze(0) >= input_lengths.unsqueeze(1)
+    
+    bert_dur = model.bert(tokens, attention_mask=(~text_mask).int())
+    d_en = model.bert_encoder(bert_dur).transpose(-1, -2)
+    s = ref_s[:, 128:]
+    d = model.predictor.text_encoder(d_en, s, input_lengths, text_mask)
+    t_en = model.text_encoder(tokens, input_lengths, text_mask)
+    
+    audio = []
+    for i, length in enumerate(input_lengths.tolist()):
+        d_i = d[i:i + 1, :length]
+        x, _ = model.predictor.lstm(d_i)
+        duration = torch.sigmoid(model.predictor.duration_proj(x)).sum(axis=-1) / speed
+        pred_dur = torch.round(duration).clamp(min=1).long()[0].tolist()
+        pred_aln_trg = torch.zeros(length, sum(pred_dur), device=device)
+        c_frame = 0
+        for j, frames in enumerate(pred_dur):
+            pred_aln_trg[j, c_frame:c_frame + frames] = 1
+            c_frame += frames
+        en = d_i.transpose(-1, -2) @ pred_aln_trg.unsqueeze(0)
+        F0_pred, N_pred = model.predictor.F0Ntrain(en, s[i:i + 1])
+        asr = t_en[i:i + 1, :, :length] @ pred_aln_trg.unsqueeze(0)
+        audio.append(model.decoder(asr, F0_pred, N_pred, ref_s[i:i + 1, :128]).squeeze().cpu().numpy())
+    return audio
+
+def join_audio(segments):
+    """Join the audio of the pieces of one chunk"""
+    # Keep 4-byte samples end to end, a float64 chunk would double playback and save bandwidth
+    if not segments:
+        return numpy.zeros(0, dtype=numpy.float32)
+    if len(segments) == 1:  # The usual case, no copy needed
+        return numpy.ascontiguousarray(segments[0], dtype=numpy.float32)
+    # Cast while copying into the single output buffer instead of in a second pass
+    return numpy.concatenate(segments, dtype=numpy.float32)
+
 class TTSSession:
-    def __init__(self, save_path=None, autoplay=True, total_chunks=0):
+    def __init__(self, save_path=None, autoplay=True, total_chunks=0, stream_audio=False):
         self.save_path = save_path
         self.autoplay = autoplay
         self.total_chunks = total_chunks
-        self.audio_chunks = []
+        self.stream_audio = stream_audio  # Forward PCM chunks to the client as binary frames
+        # Nobody is listening live, so chunks can wait and be synthesized as one batch
+        self.batch_chunks = not autoplay and not stream_audio and total_chunks > 1
+        self.pending_chunks = []  # (text, engine voice) waiting for the next batch
+        self.engine_voices = {}  # (voice, language) -> engine voice, resolved once per session
+        self.sf_writer = None  # Saved file, opened with the first chunk
+        self.sf_lock = threading.Lock()  # Writes run in the executor, stop() may close the file meanwhile
+        self.closed = False  # Set by close(), chunks still in flight are dropped
+        self.audio_queue = asyncio.Queue()  # Generated chunks waiting to be played/streamed
+        self.player = None
         self.current_chunk = 0
-        self.start_time = asyncio.get_event_loop().time()
+        self.start_time = time.perf_counter()
         self.total_chars = 0
 
+    async def add_audio(self, audio, is_last_chunk):
+        """Hand a generated chunk to the player and the saved file"""
+        if self.closed:
+            return
+        
+        # Drop the dead air before the first and after the last chunk, keep the pauses between chunks
+        if self.current_chunk == 0 or is_last_chunk:
+            audio = trim_silence(audio, leading=self.current_chunk == 0, trailing=is_last_chunk)
+        
+        if self.player is not None:
+            self.audio_queue.put_nowait(audio)
+        if self.save_path:
+            # Disk writes would stall every other client if they ran on the event loop
+            await asyncio.get_running_loop().run_in_executor(None, self.write_audio, audio)
+        self.current_chunk += 1
+
+    def write_audio(self, audio):
+        """Append a chunk to the saved file, opening it with the first chunk"""
+        with self.sf_lock:
+            if self.closed:
+                return  # Reopening in 'w' mode would truncate what was saved so far
+            if self.sf_writer is None:
+                if sf is None:
+                    raise RuntimeError("soundfile is not installed, cannot save audio")
+                logging.info(f"Saving audio to {self.save_path}")
+                os.makedirs(os.path.dirname(self.save_path), exist_ok=True)
+                self.sf_writer = sf.SoundFile(self.save_path, 'w', samplerate=24000, channels=1, subtype='PCM_16')
+            self.sf_writer.write(to_pcm16(audio))
+
+    def close(self):
+        """Finish the saved file, if any"""
+        # Flagged before taking the lock, so chunks queued behind a running write are dropped
+        self.closed = True
+        with self.sf_lock:
+            if self.sf_writer is not None:
+                self.sf_writer.close()
+                self.sf_writer = None
+
+class AutocastModule(torch.nn.Module):
+    """Run a Kokoro submodule under autocast while handing float32 back to the Kokoro code"""
+    def __init__(self, module, device_type, dtype):
+        super().__init__()
+        self.module = module
+        self.device_type = device_type
+        self.dtype = dtype
+
+    def forward(self, *args, **kwargs):
+        with torch.autocast(device_type=self.device_type, dtype=self.dtype):
+            out = self.module(*args, **kwargs)
+        return out.float()
+
+class FullPrecisionModule(torch.nn.Module):
+    """Run a Kokoro submodule in float32 with autocast off, for ops without half precision kernels"""
+    def __init__(self, module, device_type):
+        super().__init__()
+        self.module = module
+        self.device_type = device_type
+
+    def forward(self, *args):
+        args = [arg.float() if torch.is_tensor(arg) and arg.is_floating_point() else arg for arg in args]
+        with torch.autocast(device_type=self.device_type, enabled=False):
+            return self.module(*args)
+
+class BucketPadModule(torch.nn.Module):
+    """Pad PL-BERT's tokens to the next bucket length, so a reduce-overhead compiled PL-BERT records a
+    CUDA graph per bucket rather than one per chunk length"""
+    def __init__(self, module):
+        super().__init__()
+        self.module = module
+
+    def forward(self, tokens, attention_mask):
+        length = tokens.shape[1]
+        bucket = next((bucket for bucket in TOKEN_BUCKETS if bucket >= length), length)
+        if bucket == length:
+            return self.module(tokens, attention_mask=attention_mask)
+        
+        # Padding is masked out, so the real positions come out as without padding
+        tokens = torch.nn.functional.pad(tokens, (0, bucket - length))
+        attention_mask = torch.nn.functional.pad(attention_mask, (0, bucket - length))
+        return self.module(tokens, attention_mask=attention_mask)[:, :length]
+
+class CudaGraphModule(torch.nn.Module):
+    """Replay captured CUDA graphs of PL-BERT, padding the tokens to a few fixed lengths so each
+    length bucket is captured once and later calls cost a single graph launch"""
+    def __init__(self, module):
+        super().__init__()
+        self.module = module
+        self.graphs = {}  # (batch size, bucket) -> (graph, static tokens, static mask, static output)
+        self.lock = threading.Lock()  # Static buffers are shared by every caller
+        # One memory pool for all graphs, safe since replays are serialized by the lock
+        self.pool = torch.cuda.graph_pool_handle()
+
+    def capture(self, batch_size, bucket, device):
+        static_tokens = torch.zeros(batch_size, bucket, dtype=torch.long, device=device)
+        static_mask = torch.zeros(batch_size, bucket, dtype=torch.int32, device=device)
+        
+        # Run on a side stream first so lazy initialization stays out of the graph
+        stream = torch.cuda.Stream()
+        stream.wait_stream(torch.cuda.current_stream())
+        with torch.cuda.stream(stream):
+            for _ in range(3):
+                self.module(static_tokens, attention_mask=static_mask)
+        torch.cuda.current_stream().wait_stream(stream)
+        
+        graph = torch.cuda.CUDAGraph()
+        with torch.cuda.graph(graph, pool=self.pool):
+            static_out = self.module(static_tokens, attention_mask=static_mask)
+        self.graphs[batch_size, bucket] = (graph, static_tokens, static_mask, static_out)
+
+    def forward(self, tokens, attention_mask):
+        batch_size, length = tokens.shape
+        bucket = next((bucket for bucket in TOKEN_BUCKETS if bucket >= length), None)
+        # Only the shapes captured at startup replay, capturing during requests would race other
+        # threads and add a graph per batch size. Batches amortize launches anyway.
+        if (batch_size, bucket) not in self.graphs:
+            return self.module(tokens, attention_mask=attention_mask)
+        
+        with self.lock:
+            graph, static_tokens, static_mask, static_out = self.graphs[batch_size, bucket]
+            # Padding is masked out, so the real positions come out as without padding
+            static_tokens.zero_()
+            static_mask.zero_()
+            static_tokens[:, :length] = tokens
+            static_mask[:, :length] = attention_mask
+            graph.replay()
+            return static_out[:, :length].clone()
+
 class KokoroTTSBackend:
     # Voice name mapping
     VOICE_DEFAULTS = {
@@ -68,36 +324,334 @@ class KokoroTTSBackend:
         'f_sky': 'a',       # Sky - US
     }
 
-    def __init__(self, model_path, voices_path):
+    # Number of voicepacks kept in memory
+    VOICE_CACHE_SIZE = 8
+    
+    # Most chunks synthesized in one model pass for sessions that are only saved
+    MAX_BATCH_SIZE = 8
+    
+    # Samples handed to the device per write, a stop cuts playback within one slice (100 ms)
+    PLAYBACK_SLICE = 2400
+    
+    # Phonemized texts remembered, longer texts rarely repeat and aren't cached
+    PHONEME_CACHE_SIZE = 4096
+    PHONEME_CACHE_MAX_CHARS = 500
+
+    # Model parts called directly by kokoro.forward(), the only ones that can be wrapped
+    OPTIMIZED_PARTS = ('bert', 'bert_encoder', 'text_encoder', 'decoder')
+    # Parts run in half precision with --fp16. The decoder's iSTFTNet stays FP32, torch.stft has no
+    # bfloat16 kernels and cuFFT only does float16 for power-of-two sizes (it uses n_fft=20).
+    HALF_PARTS = ('bert', 'bert_encoder', 'text_encoder')
+
+    def __init__(self, model_path, voices_path, compile_model=False, fp16=False, workers=1, warmup=True):
         self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
         logging.info(f"Using device: {self.device}")
+        self.phonemizer_lock = threading.Lock()  # espeak-ng is not safe to call from several threads
+        # Replays and repeated filler ("Chapter", "...") skip espeak-ng
+        self.cached_phonemize = functools.lru_cache(maxsize=self.PHONEME_CACHE_SIZE)(self.locked_phonemize)
+        self.half_dtype = None  # Set when the weights are cast to half precision
+        # Voicepacks are copied to the GPU on their own stream so loads don't wait behind running inference
+        self.copy_stream = torch.cuda.Stream() if self.device == 'cuda' else None
         
         # Load model
         try:
-            self.model = build_model(model_path, self.device)
+            self.load_model(model_path)
             logging.info("Model loaded")
         except Exception as e:
             logging.error(f"Failed to load model: {str(e)}")
             raise
         
-        # Load voices
-        self.voices = {}
-        voices_dir = Path(voices_path)
-        for voice_file in voices_dir.glob("*.pt"):
-            # Get base voice name by removing language prefix
+        # Find voices, they are loaded on first use
+        self.voice_files = {}
+        for voice_file in Path(voices_path).glob("*.pt"):
+            # Get base voice name by removing language prefix, both US and GB variants share the file
             voice_name = voice_file.stem
             base_name = voice_name[1:] if voice_name.startswith(('a', 'b')) else voice_name
+            if base_name in self.voice_files:
+                logging.warning(f"Voice files {self.voice_files[base_name].name} and {voice_file.name} "
+                                f"share the name '{base_name}', using {voice_file.name}")
+            self.voice_files[base_name] = voice_file
+        self.voice_cache = OrderedDict()
+        self.voice_cache_lock = threading.Lock()
             
-            # Load voice for both US and GB variants
-            voice_data = torch.load(voice_file, weights_only=True).to(self.device)
-            self.voices['a' + base_name] = voice_data  # US variant
-            self.voices['b' + base_name] = voice_data  # GB variant
-            
-        logging.info(f"Loaded {len(self.voices) // 2} voices")
+        logging.info(f"Found {len(self.voice_files)} voices")
+        
+        # Synthesis requests from all clients go through one queue, served by a fixed number of
+        # workers each running inference on its own thread. One is enough on CPU since torch
+        # already parallelizes each forward.
+        self.worker_count = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='kokoro')
+        # Compiled CUDA graphs live in thread-local state, prepare the model on the thread serving requests
+        self.executor.submit(self.prepare_model, compile_model, fp16, warmup).result()
+        self.preload_voices()
+        
+        self.work_queue = asyncio.Queue()
+        self.workers = [asyncio.create_task(self.inference_worker()) for _ in range(workers)]
         
         self.current_audio = None
-        self.stop_event = asyncio.Event()
+        self.stop_event = threading.Event()  # Read by the playback thread between slices
         self.sessions = {}  # Store active TTS sessions
+        self.players = set()  # Running playback tasks, also for sessions that finished generating
+        
+        # Open the playback stream once, reopening a device per utterance costs tens of ms
+        self.output_stream = self.open_output_stream()
+        # PortAudio streams can't be written from several threads, every call on the stream goes
+        # through this one thread
+        self.playback_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='playback')
+        self.playback_session = None  # Only the latest autoplay session plays, a new one preempts it
+
+    def open_output_stream(self):
+        if sd is None:
+            logging.error("sounddevice is not available, audio will not be played")
+            return None
+        try:
+            stream = sd.OutputStream(samplerate=24000, channels=1, dtype='float32', blocksize=256, latency='low')
+            stream.start()
+            return stream
+        except Exception as e:
+            logging.error(f"Could not open audio output: {str(e)}")
+            return None
+
+    def load_model(self, model_path):
+        self.model = build_model(model_path, self.device)
+
+    def load_voice(self, voice_file):
+        """Load a voicepack in the form the engine consumes"""
+        if self.copy_stream is None:
+            return self.read_voice(voice_file, self.device).to(dtype=self.half_dtype)
+        
+        voice_data = self.read_voice(voice_file, 'cpu').pin_memory()
+        with torch.cuda.stream(self.copy_stream):
+            voice_data = voice_data.to(self.device, dtype=self.half_dtype, non_blocking=True)
+        # Only this loading thread waits, the compute stream keeps running
+        self.copy_stream.synchronize()
+        return voice_data
+
+    def read_voice(self, voice_file, device):
+        """Read a voicepack, from its .safetensors sibling (see convert_voices.py) when there is one"""
+        converted = voice_file.with_suffix('.safetensors')
+        if load_safetensors is not None and converted.exists():
+            # Memory-mapped, no unpickling
+            return load_safetensors(str(converted), device=device)['emb']
+        return torch.load(voice_file, weights_only=True, map_location=device)
+
+    def prepare_model(self, compile_model, fp16, warmup):
+        """Optimize and warm up the model before serving"""
+        # Optimizing always runs a check pass, it needs a voice for that and makes the warm-up redundant
+        optimize = (compile_model or fp16) and bool(self.voice_files)
+        if (compile_model or fp16) and not optimize:
+            logging.warning("No voices found, not optimizing the model")
+        compiled = self.optimize_model(compile_model, fp16) if optimize else False
+        if self.device == 'cuda' and not compiled:
+            # A compiled PL-BERT already records its own CUDA graphs, or would not replay ours
+            self.enable_cuda_graphs()
+        if warmup and self.voice_files and not optimize:
+            self.warm_up()
+
+    def optimize_model(self, compile_model, fp16):
+        """Wrap the model with autocast and/or torch.compile, keeping eager FP32 if it fails. Returns
+        whether torch.compile took effect."""
+        eager_parts = {name: self.model[name] for name in self.OPTIMIZED_PARTS}
+        if self.device == 'cuda' and not torch.cuda.is_bf16_supported():
+            dtype = torch.float16
+        else:
+            dtype = torch.bfloat16
+        
+        if compile_model and TORCH_VERSION < (2, 1):
+            logging.info(f"torch.compile needs PyTorch 2.1 or newer (found {torch.__version__}), not compiling")
+            compile_model = False
+            if not fp16:
+                self.script_model()
+                return False
+        
+        fp32_weights = None
+        try:
+            if fp16 and self.device == 'cuda':
+                # Casting back from half precision loses bits, keep an exact copy to restore on failure
+                fp32_weights = {name: {key: value.detach().to('cpu', copy=True)
+                                       for key, value in self.model[name].state_dict().items()}
+                                for name in self.HALF_PARTS}
+                # Halve weight and voicepack bandwidth, autocast alone keeps FP32 weights
+                for name in self.HALF_PARTS:
+                    self.model[name].to(dtype)
+                self.half_dtype = dtype
+                self.voice_cache.clear()
+            
+            for name, part in eager_parts.items():
+                if fp16 and name in self.HALF_PARTS:
+                    part = AutocastModule(part, self.device, dtype)
+                elif self.half_dtype is not None:
+                    # Inference runs under autocast once weights are cast, keep it out of the decoder
+                    part = FullPrecisionModule(part, self.device)
+                if compile_model:
+                    # Reduce-overhead records a CUDA graph per input shape, only PL-BERT's inputs are
+                    # padded to a few lengths. The other parts see a new length on almost every chunk.
+                    # Its graphs belong to the thread that compiled them, so only with a single worker.
+                    if self.device == 'cuda' and name == 'bert' and self.worker_count == 1:
+                        mode = 'reduce-overhead'
+                    else:
+                        mode = 'default'
+                    part = torch.compile(part, mode=mode, dynamic=True, fullgraph=False, backend='inductor')
+                    if mode == 'reduce-overhead':
+                        # Padding only pays for itself when each shape gets its own graph
+                        part = BucketPadModule(part)
+                self.model[name] = part
+            
+            # Compilation and unsupported ops only surface on the first call
+            self.warm_up()
+            logging.info(f"Model optimized (compile: {compile_model}, autocast: {dtype if fp16 else None})")
+            return compile_model
+        except Exception as e:
+            logging.error(f"Could not optimize model, using FP32 eager mode: {str(e)}")
+            for name, part in eager_parts.items():
+                self.model[name] = part
+            if fp32_weights is not None:
+                for name, weights in fp32_weights.items():
+                    self.model[name].float()
+                    self.model[name].load_state_dict(weights)
+                self.half_dtype = None
+                self.voice_cache.clear()
+            elif compile_model:
+                self.script_model()
+            return False
+
+    def script_model(self):
+        """TorchScript fallback for when torch.compile is unavailable or fails, part by part since not all of Kokoro scripts"""
+        eager_parts = {}
+        for name in self.OPTIMIZED_PARTS:
+            part = self.model[name]
+            try:
+                # Freezing folds the weights into the graph so the fuser can merge the pointwise ops
+                scripted = torch.jit.optimize_for_inference(torch.jit.script(part.eval()))
+                self.model[name] = scripted
+                eager_parts[name] = part
+            except Exception as e:
+                logging.info(f"Could not script {name}, keeping it eager: {str(e)}")
+        if not eager_parts:
+            return
+        
+        try:
+            # The profiling executor specializes on the second call
+            self.warm_up()
+            self.warm_up()
+            logging.info(f"Model scripted with TorchScript ({', '.join(eager_parts)})")
+        except Exception as e:
+            logging.error(f"Scripted model failed, using eager mode: {str(e)}")
+            for name, part in eager_parts.items():
+                self.model[name] = part
+
+    def enable_cuda_graphs(self):
+        """Replay single-sequence PL-BERT from CUDA graphs, capturing every length bucket now while no
+        other thread is using the GPU"""
+        eager_bert = self.model.bert
+        try:
+            self.model.bert = CudaGraphModule(eager_bert)
+            with torch.inference_mode():
+                for bucket in TOKEN_BUCKETS:
+                    self.model.bert.capture(1, bucket, self.device)
+            logging.info(f"Captured CUDA graphs for token buckets {TOKEN_BUCKETS}")
+        except Exception as e:
+            logging.error(f"Could not capture CUDA graphs, running PL-BERT eagerly: {str(e)}")
+            self.model.bert = eager_bert
+
+    def warm_up(self):
+        """Run a throwaway synthesis so lazy init, autotuning and compilation happen before the first request"""
+        base_name = 'f' if 'f' in self.voice_files else next(iter(self.voice_files))
+        start = time.perf_counter()
+        self.synthesize("Warming up the model.", 'a' + base_name)
+        logging.info(f"Warm-up synthesis took {time.perf_counter() - start:.1f}s")
+
+    def get_voice(self, engine_voice):
+        """Load a voicepack on first use, keeping the most recently used ones in memory"""
+        base_name = engine_voice[1:]
+        with self.voice_cache_lock:
+            try:
+                self.voice_cache.move_to_end(base_name)
+                return self.voice_cache[base_name]
+            except KeyError:
+                pass
+        
+        # Load outside the lock so loads of different voices run in parallel
+        try:
+            voice_file = self.voice_files[base_name]
+        except KeyError:
+            raise ValueError(f"Voice {engine_voice} not found") from None
+        voice_data = self.load_voice(voice_file)
+        with self.voice_cache_lock:
+            self.voice_cache[base_name] = voice_data
+            self.voice_cache.move_to_end(base_name)
+            if len(self.voice_cache) > self.VOICE_CACHE_SIZE:
+                self.voice_cache.popitem(last=False)
+        return voice_data
+
+    def preload_voices(self):
+        """Fill the voice cache from a thread pool in the background, the server doesn't wait for it"""
+        base_names = sorted(self.voice_files, key=lambda name: name != 'f')[:self.VOICE_CACHE_SIZE]
+        if not base_names:
+            return
+        pool = ThreadPoolExecutor(max_workers=min(8, len(base_names)), thread_name_prefix='voices')
+        for base_name in base_names:
+            pool.submit(self.get_voice, 'a' + base_name)
+        pool.shutdown(wait=False)
+
+    def locked_phonemize(self, text, lang):
+        """Call espeak-ng through Kokoro, one thread at a time"""
+        with self.phonemizer_lock:
+            return phonemize(text, lang)
+
+    def phonemize(self, text, lang):
+        """Phonemize text, reusing the result for texts seen before"""
+        text = text.strip()
+        if len(text) > self.PHONEME_CACHE_MAX_CHARS:
+            return self.locked_phonemize(text, lang)
+        return self.cached_phonemize(text, lang)
+
+    def synthesize(self, text, engine_voice):
+        """Run Kokoro on the calling thread, one pass per piece of text that fits the model"""
+        voice = self.get_voice(engine_voice)
+        lang = engine_voice[0]  # Language code is the engine voice prefix
+        phonemes = self.phonemize(text, lang)
+        segments = [tokenize(piece)[:MAX_TOKENS] for piece in split_phonemes(phonemes)]
+        return join_audio([self.infer(tokens, voice) for tokens in segments if tokens]), phonemes
+
+    def synthesize_batch(self, texts, engine_voices):
+        """Like synthesize() for several chunks, running the model once over all their pieces"""
+        phonemes = [self.phonemize(text, engine_voice[0]) for text, engine_voice in zip(texts, engine_voices)]
+        
+        # Overlong chunks are split as in synthesize(), every piece becomes one batch item
+        pieces = []  # (chunk index, tokens)
+        for i, chunk_phonemes in enumerate(phonemes):
+            for piece in split_phonemes(chunk_phonemes):
+                tokens = tokenize(piece)[:MAX_TOKENS]
+                if tokens:
+                    pieces.append((i, tokens))
+        
+        segments = [[] for _ in texts]
+        if pieces:
+            voices = [self.get_voice(engine_voices[i]) for i, _ in pieces]
+            outputs = self.infer_batch([tokens for _, tokens in pieces], voices)
+            for (i, _), audio in zip(pieces, outputs):
+                segments[i].append(audio)
+        return [(join_audio(chunk_segments), chunk_phonemes)
+                for chunk_segments, chunk_phonemes in zip(segments, phonemes)]
+
+    def autocast(self):
+        """Autocast when the weights are in half precision, so the FP32 tensors kokoro.forward() builds
+        itself (alignment matrix) can be mixed with them"""
+        if self.half_dtype is None:
+            return contextlib.nullcontext()
+        return torch.autocast(device_type=self.device, dtype=self.half_dtype)
+
+    def infer(self, tokens, voice):
+        """Run the model on a single token sequence"""
+        with torch.inference_mode(), self.autocast():
+            return forward(self.model, tokens, voice[len(tokens)], 1)
+
+    def infer_batch(self, token_lists, voices):
+        """Run the model on several token sequences at once"""
+        ref_s = torch.cat([voice[len(tokens)] for tokens, voice in zip(token_lists, voices)])
+        with torch.inference_mode(), self.autocast():
+            return forward_batch(self.model, token_lists, ref_s)
 
     def get_engine_voice_name(self, voice_name: str, language: str) -> str:
         """Get the full voice name for the engine with appropriate language prefix"""
@@ -111,64 +665,236 @@ class KokoroTTSBackend:
         lang_prefix = 'a' if language == 'en-us' else ('b' if language == 'en-gb' else default_lang)
         engine_voice = lang_prefix + base_name
         
-        logging.info(f"Voice mapping: {voice_name} -> {engine_voice} (language: {language}, default: {default_lang})")
-        return engine_voice
-
-    async def generate_speech(self, text, voice_name='f', language='default'):
-        # Get full voice name for engine
-        engine_voice = self.get_engine_voice_name(voice_name, language)
-        
-        if engine_voice not in self.voices:
+        if base_name not in self.voice_files:
             raise ValueError(f"Voice {engine_voice} not found")
-            
-        # Get language code from engine voice name
-        lang = engine_voice[0]
-        logging.info(f"Using voice: {engine_voice} (lang: {lang})")
         
-        # Generate audio
-        audio, phonemes = generate(
-            self.model,
-            text,
-            self.voices[engine_voice],
-            lang=lang
-        )
+        logging.debug(f"Voice mapping: {voice_name} -> {engine_voice} (language: {language}, default: {default_lang})")
+        return engine_voice
+
+    async def generate_speech(self, text, engine_voice):
+        # Queue the request for the inference workers and wait for its result
+        audio, phonemes = await self.run_inference(self.synthesize, text, engine_voice)
             
         return audio, phonemes
 
-    def concatenate_audio(self, audio_chunks):
-        """Concatenate multiple audio chunks into a single audio stream"""
-        if not audio_chunks:
-            return numpy.array([])
-        return numpy.concatenate(audio_chunks)
-            
+    async def generate_batch(self, chunks):
+        """Generate several (text, engine voice) chunks in one model pass"""
+        logging.debug(f"Generating a batch of {len(chunks)} chunks")
+        return await self.run_inference(self.synthesize_batch, [text for text, _ in chunks],
+                                        [engine_voice for _, engine_voice in chunks])
+
+    async def run_inference(self, func, *args):
+        """Queue an inference call for the workers and wait for its result"""
+        future = asyncio.get_running_loop().create_future()
+        await self.work_queue.put((func, args, future))
+        return await future
+
+    async def inference_worker(self):
+        """Run queued synthesis requests without blocking the event loop (pings, stop and other clients)"""
+        loop = asyncio.get_running_loop()
+        while True:
+            func, args, future = await self.work_queue.get()
+            if future.done():  # Requester went away
+                continue
+            try:
+                result = await loop.run_in_executor(self.executor, func, *args)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
+
     async def play_audio(self, audio):
-        if audio is None:
+        if audio is None or len(audio) == 0:
+            return
+            
+        if self.output_stream is None:
             return
             
         try:
-            import sounddevice as sd
-            self.stop_event.clear()
-            sd.play(audio, 24000)
-            await asyncio.sleep(0)  # Let other tasks run
-            sd.wait()
+            assert audio.dtype == numpy.float32, f"Expected float32 audio, got {audio.dtype}"
+            # write() blocks until the chunk is handed to the device, keep it off the event loop
+            await asyncio.get_running_loop().run_in_executor(self.playback_executor, self.write_output, audio)
         except Exception as e:
             logging.error(f"Error playing audio: {str(e)}")
+
+    def write_output(self, audio):
+        """Write audio to the device in short slices, giving up as soon as playback is interrupted"""
+        for start in range(0, len(audio), self.PLAYBACK_SLICE):
+            if self.stop_event.is_set():
+                return
+            self.output_stream.write(audio[start:start + self.PLAYBACK_SLICE])
+
+    def reset_output(self):
+        """Drop the audio queued on the device, on the playback thread once the current write gave up"""
+        try:
+            # Restart right away instead of reopening the device
+            self.output_stream.abort()
+            self.output_stream.start()
+        except Exception as e:
+            logging.error(f"Error resetting audio output: {str(e)}")
+        finally:
+            self.stop_event.clear()
+
+    def interrupt_playback(self):
+        """Cut off whatever is playing, writes queued after this call play normally"""
+        if self.output_stream is None:
+            return
+        self.stop_event.set()
+        self.playback_executor.submit(self.reset_output)
+
+    def start_player(self, session, websocket):
+        """Start playing/streaming a session's chunks as soon as they are generated"""
+        if session.autoplay:
+            # Starting a new read silences the previous one if it is still playing, it keeps
+            # generating/saving/streaming. Once its player is done the device is left alone, so the
+            # tail still buffered there plays out and the stream isn't restarted per utterance.
+            previous = self.playback_session
+            if previous is not None and previous.player is not None and not previous.player.done():
+                self.interrupt_playback()
+            self.playback_session = session
+        session.player = asyncio.create_task(self.run_player(session, websocket))
+        self.players.add(session.player)
+        session.player.add_done_callback(self.players.discard)
+
+    async def run_player(self, session, websocket):
+        try:
+            while True:
+                audio = await session.audio_queue.get()
+                if audio is None:  # End of session
+                    break
+                if session.stream_audio:
+                    # Announce the binary frame so the client knows how to read it
+                    await websocket.send(encode_message({
+                        'status': 'audio_chunk',
+                        'samples': len(audio),
+                        'sample_rate': 24000,
+                        'dtype': 'int16'
+                    }))
+                    await websocket.send(to_pcm16(audio).tobytes())
+                if session is self.playback_session:
+                    await self.play_audio(audio)
+        finally:
+            if self.playback_session is session:
+                self.playback_session = None
             
     def stop(self):
-        self.stop_event.set()
-        import sounddevice as sd
-        sd.stop()
+        self.playback_session = None
+        self.interrupt_playback()
+        loop = asyncio.get_running_loop()
+        for session in self.sessions.values():
+            # Drop the chunks still in flight now, close the file off the event loop since a
+            # write in progress holds its lock
+            session.closed = True
+            loop.run_in_executor(None, session.close)
+        self.sessions.clear()  # Clear all active sessions
+        for player in list(self.players):
+            player.cancel()
+
+    def close(self):
+        """Release the inference thread and the audio device on shutdown"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.stop_event.set()  # The write in progress returns within a slice
+        self.playback_executor.shutdown(wait=True, cancel_futures=True)
+        if self.output_stream is not None:
+            self.output_stream.close()
+
+class OnnxTTSBackend(KokoroTTSBackend):
+    """Kokoro running on ONNX Runtime, phonemization still comes from the Kokoro modules"""
+    PROVIDERS = ['CUDAExecutionProvider', 'OpenVINOExecutionProvider', 'CPUExecutionProvider']
+
+    def load_model(self, model_path):
+        available = onnxruntime.get_available_providers()
+        providers = [provider for provider in self.PROVIDERS if provider in available]
+        self.session = onnxruntime.InferenceSession(model_path, providers=providers)
+        logging.info(f"Using ONNX Runtime providers: {self.session.get_providers()}")
+        
+        # Older exports name the phoneme input 'tokens', newer ones 'input_ids'
+        input_names = [model_input.name for model_input in self.session.get_inputs()]
+        self.tokens_input = 'input_ids' if 'input_ids' in input_names else 'tokens'
+
+    def load_voice(self, voice_file):
+        return self.read_voice(voice_file, 'cpu').numpy()
+
+    def optimize_model(self, compile_model, fp16):
+        logging.info("Model compilation and autocast are not used with ONNX Runtime")
+        return False
+
+    def enable_cuda_graphs(self):
+        pass  # ONNX Runtime schedules its own kernels
+
+    def infer(self, tokens, voice):
+        audio = self.session.run(None, {
+            self.tokens_input: numpy.array([[0, *tokens, 0]], dtype=numpy.int64),
+            'style': voice[len(tokens)],
+            'speed': numpy.ones(1, dtype=numpy.float32)
+        })[0]
+        return audio.squeeze()
+
+    def infer_batch(self, token_lists, voices):
+        # The exported graph takes a single sequence
+        return [self.infer(tokens, voice) for tokens, voice in zip(token_lists, voices)]
+
+def create_backend():
+    """Create the backend selected on the command line"""
+    # Opt-in: Inductor has no Triton for CUDA on Windows, and compiling can outlast the plugin's
+    # connection timeout
+    compile_model = bool(args.compile)
+    if args.backend == 'onnx':
+        if onnxruntime is not None:
+            onnx_path = args.onnx_model or str(Path(args.model_path).with_suffix('.onnx'))
+            return OnnxTTSBackend(onnx_path, args.voices_path, compile_model, args.fp16, args.workers, args.warmup)
+        logging.warning("onnxruntime is not installed, falling back to PyTorch")
+    return KokoroTTSBackend(args.model_path, args.voices_path, compile_model, args.fp16, args.workers, args.warmup)
+
+def encode_message(payload):
+    """Serialize a status message, sent as a text frame since binary frames carry audio"""
+    return orjson.dumps(payload).decode()
+
+def find_speech(audio, threshold):
+    """Get the bounds of the non-silent part of the audio, scanning in from both ends"""
+    start = 0
+    end = len(audio)
+    while start < end and abs(audio[start]) <= threshold:
+        start += 1
+    while end > start and abs(audio[end - 1]) <= threshold:
+        end -= 1
+    return start, end
+
+if numba is not None:
+    # One early-exit pass instead of numpy's abs, compare and two argmax passes
+    find_speech = numba.njit(cache=True, fastmath=True, boundscheck=False)(find_speech)
+    find_speech(numpy.zeros(1, dtype=numpy.float32), 1e-3)  # Compile now rather than on the first chunk
+
+def trim_silence(audio, threshold=1e-3, leading=True, trailing=True):
+    """Cut the silent samples at the start and/or end of the audio"""
+    if numba is not None:
+        start, end = find_speech(audio, threshold)
+        if start == end:
+            return audio
+    else:
+        mask = numpy.abs(audio) > threshold
+        if not mask.any():
+            return audio
+        start = mask.argmax()
+        end = len(audio) - mask[::-1].argmax()
+    return audio[start if leading else 0:end if trailing else len(audio)]
+
+def to_pcm16(audio):
+    """Convert float audio in [-1, 1] to little-endian 16-bit PCM samples"""
+    return (numpy.clip(audio, -1.0, 1.0) * 32767).astype('<i2')
 
 async def handle_client(websocket, backend):
     try:
         async for message in websocket:
             try:
-                data = json.loads(message)
+                data = orjson.loads(message)
                 action = data.get('action')
                 
                 if action == 'ping':
                     # Respond to ping with pong
-                    await websocket.send(json.dumps({
+                    await websocket.send(encode_message({
                         'status': 'pong',
                         'message': 'Backend is alive'
                     }))
@@ -179,10 +905,14 @@ async def handle_client(websocket, backend):
                     save_path = data.get('save_path')
                     autoplay = data.get('autoplay', True)
                     total_chunks = data.get('total_chunks', 0)
+                    stream_audio = data.get('stream_audio', False)
                     
-                    backend.sessions[session_id] = TTSSession(save_path, autoplay, total_chunks)
+                    session = TTSSession(save_path, autoplay, total_chunks, stream_audio)
+                    if autoplay or stream_audio:
+                        backend.start_player(session, websocket)
+                    backend.sessions[session_id] = session
                     
-                    await websocket.send(json.dumps({
+                    await websocket.send(encode_message({
                         'status': 'session_started',
                         'message': 'Started new TTS session'
                     }))
@@ -199,51 +929,60 @@ async def handle_client(websocket, backend):
                     session = backend.sessions[session_id]
                     
                     # Send status update
-                    await websocket.send(json.dumps({
+                    await websocket.send(encode_message({
                         'status': 'generating',
                         'message': 'Generating speech...'
                     }))
                     
-                    # Generate audio
-                    audio, phonemes = await backend.generate_speech(text, voice, data.get('language', 'default'))
+                    # Resolve the voice on the first chunk, the session usually keeps it
+                    language = data.get('language', 'default')
+                    try:
+                        engine_voice = session.engine_voices[voice, language]
+                    except KeyError:
+                        engine_voice = backend.get_engine_voice_name(voice, language)
+                        session.engine_voices[voice, language] = engine_voice
                     
-                    # Store audio chunk and update stats
-                    session.audio_chunks.append(audio)
-                    session.current_chunk += 1
                     session.total_chars += len(text)
+                    if session.batch_chunks:
+                        # Collect chunks until the batch is full or the session ends
+                        session.pending_chunks.append((text, engine_voice))
+                        phonemes = None
+                        if is_last_chunk or len(session.pending_chunks) >= backend.MAX_BATCH_SIZE:
+                            # Take the chunks first, a failed batch must not be sent again with the next one
+                            chunks, session.pending_chunks = session.pending_chunks, []
+                            results = await backend.generate_batch(chunks)
+                            for i, (audio, phonemes) in enumerate(results):
+                                await session.add_audio(audio, is_last_chunk and i == len(results) - 1)
+                    else:
+                        # Generate audio
+                        audio, phonemes = await backend.generate_speech(text, engine_voice)
+                        await session.add_audio(audio, is_last_chunk)
                     
-                    # If this is the last chunk, concatenate and handle final audio
+                    # If this is the last chunk, finish playback and the saved file
                     if is_last_chunk:
-                        # Concatenate all chunks
-                        final_audio = backend.concatenate_audio(session.audio_chunks)
+                        if session.player is not None:
+                            session.audio_queue.put_nowait(None)
                         
                         # Calculate session stats
-                        elapsed_time = asyncio.get_event_loop().time() - session.start_time
+                        elapsed_time = time.perf_counter() - session.start_time
                         chars_per_second = session.total_chars / elapsed_time if elapsed_time > 0 else 0
                         
-                        # Save if requested
+                        # Finish the saved file
                         if session.save_path:
-                            logging.info(f"Saving concatenated audio to {session.save_path}")
-                            os.makedirs(os.path.dirname(session.save_path), exist_ok=True)
-                            import soundfile as sf
-                            sf.write(session.save_path, final_audio, 24000)
+                            await asyncio.get_running_loop().run_in_executor(None, session.close)
                             logging.info("Audio saved successfully")
                         
-                        # Play if requested
-                        if session.autoplay:
-                            await backend.play_audio(final_audio)
-                        
                         # Send completion stats
-                        await websocket.send(json.dumps({
+                        await websocket.send(encode_message({
                             'status': 'session_stats',
                             'message': f'Generated {session.total_chars:,} characters in {session.current_chunk} chunks ({elapsed_time:.1f}s, {chars_per_second:.1f} chars/s)'
                         }))
                         
                         # Clean up session
-                        del backend.sessions[session_id]
+                        backend.sessions.pop(session_id, None)  # Already gone if stopped meanwhile
                     
                     # Send completion status
-                    await websocket.send(json.dumps({
+                    await websocket.send(encode_message({
                         'status': 'generated',
                         'message': 'Speech generated',
                         'phonemes': phonemes,
@@ -252,19 +991,18 @@ async def handle_client(websocket, backend):
                         
                 elif action == 'stop':
                     backend.stop()
-                    backend.sessions.clear()  # Clear all active sessions
-                    await websocket.send(json.dumps({
+                    await websocket.send(encode_message({
                         'status': 'stopped',
                         'message': 'Speech stopped'
                     }))
                     
-            except json.JSONDecodeError:
-                await websocket.send(json.dumps({
+            except orjson.JSONDecodeError:
+                await websocket.send(encode_message({
                     'status': 'error',
                     'message': 'Invalid JSON'
                 }))
             except Exception as e:
-                await websocket.send(json.dumps({
+                await websocket.send(encode_message({
                     'status': 'error',
                     'message': str(e)
                 }))
@@ -273,7 +1011,7 @@ async def handle_client(websocket, backend):
     except websockets.exceptions.ConnectionClosed:
         logging.info("Client disconnected")
 
-async def shutdown(server):
+async def shutdown(server, backend):
     """Cleanup function for graceful shutdown"""
     logging.info("Shutting down server...")
     server.close()
@@ -282,14 +1020,12 @@ async def shutdown(server):
     for task in tasks:
         task.cancel()
     await asyncio.gather(*tasks, return_exceptions=True)
+    backend.close()
     logging.info("Server shutdown complete")
 
 async def main():
-    model_path = sys.argv[1]
-    voices_path = sys.argv[2]
-    
     try:
-        backend = KokoroTTSBackend(model_path, voices_path)
+        backend = create_backend()
     except Exception as e:
         logging.error(f"Failed to initialize backend: {str(e)}")
         sys.exit(1)
@@ -298,7 +1034,10 @@ async def main():
     server = await websockets.serve(
         lambda ws: handle_client(ws, backend),
         "localhost",
-        port
+        port,
+        compression=None,  # PCM audio does not compress, deflate would only burn CPU
+        max_size=None,  # Local connection only, no need to cap message size
+        max_queue=None
     )
     
     logging.info(f"Kokoro TTS backend running on ws://localhost:{port}")
@@ -319,15 +1058,30 @@ async def main():
         try:
             await stop_future  # wait until shutdown is triggered
         finally:
-            await shutdown(server)
+            await shutdown(server, backend)
     else:  # Unix
-        loop = asyncio.get_event_loop()
+        loop = asyncio.get_running_loop()
         for sig in (signal.SIGINT, signal.SIGTERM):
             loop.add_signal_handler(sig, lambda: stop_future.set_result(None))
         try:
             await stop_future  # wait until shutdown is triggered
         finally:
-            await shutdown(server)
+            await shutdown(server, backend)
+
+def run(coro):
+    """Run on uvloop (winloop on Windows) when installed, falling back to the stdlib event loop"""
+    try:
+        if os.name == 'nt':
+            import winloop as uvloop
+        else:
+            import uvloop
+    except ImportError:
+        return asyncio.run(coro)
+    
+    if sys.version_info >= (3, 12):
+        return asyncio.run(coro, loop_factory=uvloop.new_event_loop)
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return asyncio.run(coro)
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    run(main())
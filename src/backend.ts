@@ -43,9 +43,11 @@ export class BackendManager {
             // Start Python backend process
             const { spawn } = require('child_process');
             this.pythonProcess = spawn(this.settings.pythonPath, [
+                '-X', 'utf8',  // Read text files as UTF-8 regardless of the Windows locale
                 this.settings.backendPath,
                 this.settings.modelPath,
-                this.settings.voicesPath
+                this.settings.voicesPath,
+                ...this.settings.backendArgs.split(/\s+/).filter(arg => arg)
             ]);
 
             // Handle process events
@@ -128,6 +130,9 @@ export class BackendManager {
             };
 
             this.ws.onmessage = (event) => {
+                // Binary frames carry streamed audio, status messages are always text
+                if (typeof event.data !== 'string') return;
+
                 try {
                     const response = JSON.parse(event.data);
                     
@@ -247,6 +252,7 @@ export class BackendManager {
             // Wait for completion of each chunk
             await new Promise<void>((resolve, reject) => {
                 const handler = (event: MessageEvent) => {
+                    if (typeof event.data !== 'string') return;
                     const response = JSON.parse(event.data);
                     if (response.status === 'generated') {
                         this.ws?.removeEventListener('message', handler);
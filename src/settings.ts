@@ -7,6 +7,7 @@ export interface KokoroTTSSettings {
 	modelPath: string;
 	voicesPath: string;
 	backendPath: string;
+	backendArgs: string;
 	serverPort: number;
 	
 	// Voice settings
@@ -34,6 +35,7 @@ export const DEFAULT_SETTINGS: KokoroTTSSettings = {
 	modelPath: '',
 	voicesPath: '',
 	backendPath: '',
+	backendArgs: '',
 	serverPort: 7851,
 	
 	selectedVoice: 'f', // Default voice (Bella & Sarah mix)
@@ -162,6 +164,17 @@ export class KokoroTTSSettingTab extends PluginSettingTab {
 					await this.plugin.saveSettings();
 				}));
 
+		new Setting(containerEl)
+			.setName('Backend arguments')
+			.setDesc('Optional flags passed to kokoro_backend.py (e.g., --compile --fp16)')
+			.addText(text => text
+				.setPlaceholder('e.g., --compile --fp16')
+				.setValue(this.plugin.settings.backendArgs)
+				.onChange(async (value) => {
+					this.plugin.settings.backendArgs = value;
+					await this.plugin.saveSettings();
+				}));
+
 		// Voice Settings
 		containerEl.createEl('h3', {text: 'Voice settings'});
 